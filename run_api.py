@@ -10,10 +10,11 @@ from config import settings
 from logging_config import setup_logging
 
 if __name__ == "__main__":
-    setup_logging(level=settings.log_level)
+    setup_logging(level=settings.log_level, enqueue=True)
     uvicorn.run(
         "api.api:app",
         host=settings.api.host,
         port=settings.api.port,
         reload=settings.api.reload_server,
+        workers=None if settings.api.reload_server else settings.api.workers,
     )
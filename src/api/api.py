@@ -8,7 +8,7 @@ from loguru import logger
 
 from config import settings
 from app.graph import RAGGraph
-from app.retrieval import DocumentRetriever
+from app.retrieval import DocumentRetriever, configure_threads
 from api.schemas import (
     AskRequest,
     AskResponse,
@@ -42,9 +42,13 @@ def get_rag_graph() -> RAGGraph:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up API server...")
+    # Before the encoder runs: the inter-op pool size can only be set before first use.
+    configure_threads()
+
     try:
         logger.info("Initializing document retriever (loading embeddings model and FAISS)...")
         retriever_instance = get_retriever()
+        retriever_instance.warmup()
         stats = retriever_instance.get_stats()
         logger.info(
             f"Retriever initialized successfully. Total chunks: {stats.get('total_chunks', 0)}"
@@ -109,7 +113,7 @@ async def ask_question(request: AskRequest):
         graph = get_rag_graph()
         logger.info(f"Processing ask request: {request.query[:50]}...")
 
-        result = graph.invoke(query=request.query, messages=None)
+        result = await graph.ainvoke(query=request.query, messages=None)
 
         retrieved_docs = result.get("retrieved_docs", [])
         distances = result.get("distances", [])
@@ -185,4 +189,5 @@ if __name__ == "__main__":
         host=settings.api.host,
         port=settings.api.port,
         reload=settings.api.reload_server,
+        workers=None if settings.api.reload_server else settings.api.workers,
     )
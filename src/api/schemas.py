@@ -12,6 +12,13 @@ class StatsResponse(BaseModel):
     embedding_model: str = Field(..., description="Embedding model name")
     distance_threshold: float = Field(..., description="Distance threshold")
     context_top_k: int = Field(..., description="Number of top documents to retrieve")
+    query_cache_hits: int = Field(0, description="Query embedding cache hits")
+    query_disk_cache_hits: int = Field(0, description="Query embeddings read from the disk cache")
+    query_cache_misses: int = Field(0, description="Query embedding cache misses")
+    query_cache_hit_rate: float = Field(0.0, description="Query embedding cache hit rate")
+    results_cache_hits: int = Field(0, description="Retrieval results cache hits")
+    results_cache_misses: int = Field(0, description="Retrieval results cache misses")
+    results_cache_hit_rate: float = Field(0.0, description="Retrieval results cache hit rate")
 
 
 class AskRequest(BaseModel):
@@ -1,19 +1,26 @@
-from typing import Annotated, Literal, Optional, TypedDict
+import functools
+from pathlib import PureWindowsPath
+from typing import Annotated, Any, Callable, Coroutine, Literal, Optional, TypedDict
 
 from langchain_core.documents import Document
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from loguru import logger
 
 from config import settings
 from app.llm import create_llm, stream_response
-from app.retrieval import DocumentRetriever
-from utils import handle_graph_execution_error, retry_with_backoff
+from app.retrieval import BatchingRetriever, DocumentRetriever
+from utils import TTLCache, handle_graph_execution_error, retry_with_backoff
 
 
 def add_messages(left: list[BaseMessage], right: list[BaseMessage]) -> list[BaseMessage]:
-    return left + right
+    # Nodes that don't touch the conversation skip the copy entirely.
+    if not right:
+        return left
+    return [*left, *right]
 
 
 class GraphState(TypedDict):
@@ -25,34 +32,94 @@ class GraphState(TypedDict):
     answer: str
 
 
+def _source_name(doc: Document) -> str:
+    # PureWindowsPath splits on both "/" and "\\", so sources from either OS give a bare filename.
+    return PureWindowsPath(doc.metadata.get("source", "unknown")).name
+
+
+def _dispatch(
+    node: str,
+) -> Callable[[GraphState, RunnableConfig], Coroutine[Any, Any, dict[str, Any]]]:
+    # The compiled graph is shared by every RAGGraph, so each run resolves its
+    # instance from the config passed to ainvoke().
+    async def run(state: GraphState, config: RunnableConfig) -> dict[str, Any]:
+        rag_graph = config["configurable"]["rag_graph"]
+        return await getattr(rag_graph, node)(state)
+
+    run.__name__ = node
+    return run
+
+
 class RAGGraph:
     def __init__(
         self,
         retriever: DocumentRetriever,
         distance_threshold: Optional[float] = None,
+        stream_to_stdout: bool = False,
     ):
         self.retriever = retriever
+        self._batching_retriever = BatchingRetriever(retriever)
+        self.stream_to_stdout = stream_to_stdout
         self.distance_threshold = (
             distance_threshold
             if distance_threshold is not None
             else settings.retrieval.distance_threshold
         )
         self.llm = create_llm(streaming=True)
-        self.graph = self._build_graph()
+        self._answer_cache: TTLCache[str] = TTLCache(
+            maxsize=settings.openrouter.answer_cache_size,
+            ttl=settings.openrouter.answer_cache_ttl,
+        )
+        self._answer_prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    """You are a helpful assistant that answers questions strictly based on the provided context documents.
+Do not add information that is not explicitly supported by the context.
+When answering, cite the source documents when relevant (e.g., "Source: docX.md").
+If the context does not contain enough information to fully answer the question,
+state this explicitly instead of filling gaps from general knowledge.
+
+Context documents:
+{context}
+
+Use the conversation history to understand the context of follow-up questions.""",
+                ),
+                MessagesPlaceholder(variable_name="messages"),
+                ("human", "{query}"),
+            ]
+        )
+        self._clarify_prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    """You are a helpful assistant. The user asked a question, but the available context 
+documents are not highly relevant (distance: {distance:.3f}, lower is better). 
+
+Generate a friendly clarification question to help the user refine their query. 
+The question should be specific and guide them to provide more context or rephrase their question.
+
+Original question: {query}""",
+                ),
+            ]
+        )
+        self.graph = self._compiled_graph()
 
-    def _build_graph(self) -> StateGraph:
+    @classmethod
+    @functools.cache
+    def _compiled_graph(cls) -> CompiledStateGraph:
         workflow = StateGraph(GraphState)
 
-        workflow.add_node("retrieve", self.retrieve_node)
-        workflow.add_node("decision", self.decision_node)
-        workflow.add_node("answer", self.answer_node)
-        workflow.add_node("clarify", self.clarify_node)
+        workflow.add_node("retrieve", _dispatch("retrieve_node"))
+        workflow.add_node("decision", _dispatch("decision_node"))
+        workflow.add_node("answer", _dispatch("answer_node"))
+        workflow.add_node("clarify", _dispatch("clarify_node"))
 
         workflow.set_entry_point("retrieve")
         workflow.add_edge("retrieve", "decision")
         workflow.add_conditional_edges(
             "decision",
-            self.should_clarify,
+            cls.should_clarify,
             {
                 "answer": "answer",
                 "clarify": "clarify",
@@ -63,56 +130,55 @@ class RAGGraph:
 
         return workflow.compile()
 
-    def retrieve_node(self, state: GraphState) -> GraphState:
+    async def retrieve_node(self, state: GraphState) -> dict[str, Any]:
         query = state.get("query", "")
         if not query:
             logger.warning("Empty query in retrieve_node")
             return {
-                **state,
                 "retrieved_docs": [],
                 "distances": [],
             }
 
-        logger.info(f"[Retrieve] Processing query: {query[:50]}...")
-        documents, distances = self.retriever.get_relevant_documents(query, k=5)
+        logger.debug("[Retrieve] Processing query: {}...", query[:50])
+        documents, distances = await self._batching_retriever.get_relevant_documents(query, k=5)
 
         return {
-            **state,
             "retrieved_docs": documents,
             "distances": distances,
         }
 
-    def decision_node(self, state: GraphState) -> GraphState:
+    async def decision_node(self, state: GraphState) -> dict[str, Any]:
         distances = state.get("distances", [])
 
         if not distances:
             logger.warning("[Decision] No distances available. Asking clarification.")
             return {
-                **state,
                 "needs_clarification": True,
             }
 
-        min_distance = min(distances)
+        # FAISS returns hits sorted by ascending distance, so the first one is the closest.
+        min_distance = distances[0]
         needs_clarification = min_distance > self.distance_threshold
 
-        logger.info(
-            f"[Decision] min distance: {min_distance:.3f}, "
-            f"threshold: {self.distance_threshold:.3f}, "
-            f"clarify: {needs_clarification}"
+        logger.debug(
+            "[Decision] min distance: {:.3f}, threshold: {:.3f}, clarify: {}",
+            min_distance,
+            self.distance_threshold,
+            needs_clarification,
         )
 
         return {
-            **state,
             "needs_clarification": needs_clarification,
         }
 
-    def should_clarify(self, state: GraphState) -> Literal["answer", "clarify"]:
+    @staticmethod
+    def should_clarify(state: GraphState) -> Literal["answer", "clarify"]:
         if state.get("needs_clarification", False):
             return "clarify"
         return "answer"
 
     @retry_with_backoff(max_retries=2, backoff_factor=1.5, exceptions=(Exception,))
-    def answer_node(self, state: GraphState) -> GraphState:
+    async def answer_node(self, state: GraphState) -> dict[str, Any]:
         query = state.get("query", "")
         documents = state.get("retrieved_docs", [])
         distances = state.get("distances", [])
@@ -121,113 +187,97 @@ class RAGGraph:
         cutoff = self.distance_threshold
         filtered_docs = [doc for doc, dist in zip(documents, distances) if dist <= cutoff]
 
-        logger.info(
-            f"[Answer] Using {len(filtered_docs)}/{len(documents)} documents "
-            f"(filtered by distance threshold: {cutoff:.3f})"
+        logger.debug(
+            "[Answer] Using {}/{} documents (filtered by distance threshold: {:.3f})",
+            len(filtered_docs),
+            len(documents),
+            cutoff,
         )
 
-        context_parts = []
-        for i, doc in enumerate(filtered_docs, 1):
-            source = doc.metadata.get("source", "unknown")
-            filename = source.split("/")[-1] if "/" in source else source
-            context_parts.append(f"--- Document {i} ({filename}) ---\n{doc.page_content}\n")
-
-        context = "\n".join(context_parts)
-
-        prompt_template = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """You are a helpful assistant that answers questions strictly based on the provided context documents.
-Do not add information that is not explicitly supported by the context.
-When answering, cite the source documents when relevant (e.g., "Source: docX.md").
-If the context does not contain enough information to fully answer the question,
-state this explicitly instead of filling gaps from general knowledge.
-
-Context documents:
-{context}
+        # Same question, same chunks and same history produce the same answer.
+        cache_key = (
+            query,
+            tuple(doc.id for doc in filtered_docs),
+            tuple((message.type, message.content) for message in messages),
+        )
+        answer = self._answer_cache.get(cache_key)
+        if answer is not None:
+            logger.debug("[Answer] Serving cached response ({} characters)", len(answer))
+            if self.stream_to_stdout:
+                print(f"\n[assistant] {answer}", end="", flush=True)
+            return {
+                "answer": answer,
+                "messages": [
+                    HumanMessage(content=query),
+                    AIMessage(content=answer),
+                ],
+            }
 
-Use the conversation history to understand the context of follow-up questions.""",
-                ),
-                MessagesPlaceholder(variable_name="messages"),
-                ("human", "{query}"),
-            ]
+        context = "\n".join(
+            f"--- Document {i} ({_source_name(doc)}) ---\n{doc.page_content}\n"
+            for i, doc in enumerate(filtered_docs, 1)
         )
 
         history_messages = messages if messages else []
 
-        formatted_messages = prompt_template.format_messages(
+        formatted_messages = self._answer_prompt.format_messages(
             context=context,
             messages=history_messages,
             query=query,
         )
 
-        print("\n[assistant] ", end="", flush=True)
+        if self.stream_to_stdout:
+            print("\n[assistant] ", end="", flush=True)
         answer_tokens = []
-        for token in stream_response(self.llm, formatted_messages):
+        async for token in stream_response(
+            self.llm, formatted_messages, stream_to_stdout=self.stream_to_stdout
+        ):
             answer_tokens.append(token)
         answer = "".join(answer_tokens).strip()
 
-        logger.info(f"[Answer] Generated response ({len(answer)} characters)")
+        logger.debug("[Answer] Generated response ({} characters)", len(answer))
+        if answer:
+            self._answer_cache.set(cache_key, answer)
 
         return {
-            **state,
             "answer": answer,
-            "messages": messages
-            + [
+            # The add_messages reducer appends this turn to the existing history.
+            "messages": [
                 HumanMessage(content=query),
                 AIMessage(content=answer),
             ],
         }
 
     @retry_with_backoff(max_retries=2, backoff_factor=1.5, exceptions=(Exception,))
-    def clarify_node(self, state: GraphState) -> GraphState:
+    async def clarify_node(self, state: GraphState) -> dict[str, Any]:
         query = state.get("query", "")
-        messages = state.get("messages", [])
         distances = state.get("distances", [])
-        min_distance = min(distances) if distances else 1.0
-
-        logger.info("[Clarify] Generating clarification question...")
-
-        prompt_template = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """You are a helpful assistant. The user asked a question, but the available context 
-documents are not highly relevant (distance: {distance:.3f}, lower is better). 
+        min_distance = distances[0] if distances else 1.0
 
-Generate a friendly clarification question to help the user refine their query. 
-The question should be specific and guide them to provide more context or rephrase their question.
+        logger.debug("[Clarify] Generating clarification question...")
 
-Original question: {query}""",
-                ),
-            ]
-        )
-
-        formatted_messages = prompt_template.format_messages(
+        formatted_messages = self._clarify_prompt.format_messages(
             distance=min_distance,
             query=query,
         )
 
-        print("\n[assistant] ", end="", flush=True)
-        response = self.llm.invoke(formatted_messages)
+        response = await self.llm.ainvoke(formatted_messages)
         clarification = response.content.strip()
-        print(clarification)
+        if self.stream_to_stdout:
+            print(f"\n[assistant] {clarification}")
 
-        logger.info(f"[Clarify] Generated clarification question")
+        logger.debug("[Clarify] Generated clarification question")
 
         return {
-            **state,
             "answer": clarification,
-            "messages": messages
-            + [
+            "messages": [
                 HumanMessage(content=query),
                 AIMessage(content=clarification),
             ],
         }
 
     @handle_graph_execution_error
-    def invoke(self, query: str, messages: list[BaseMessage] | None = None) -> GraphState:
+    async def ainvoke(self, query: str, messages: list[BaseMessage] | None = None) -> GraphState:
         initial_state: GraphState = {
             "messages": messages or [],
             "query": query,
@@ -237,5 +287,8 @@ Original question: {query}""",
             "answer": "",
         }
 
-        result = self.graph.invoke(initial_state)
+        result = await self.graph.ainvoke(
+            initial_state,
+            config={"configurable": {"rag_graph": self}},
+        )
         return result
@@ -1,5 +1,6 @@
-from typing import Any, Callable, Iterator, Optional
+from typing import Any, AsyncIterator, Callable, Optional
 
+import httpx
 from langchain_openai import ChatOpenAI
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.messages import BaseMessage
@@ -29,17 +30,28 @@ def create_llm(
         streaming=streaming,
         timeout=timeout,
         max_retries=max_retries,
+        # One pooled keep-alive client per LLM, so concurrent requests reuse connections
+        # instead of opening a new TLS session per call.
+        http_async_client=httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=settings.openrouter.max_connections,
+                max_keepalive_connections=settings.openrouter.max_keepalive_connections,
+            ),
+        ),
     )
 
     return llm
 
 
-def stream_response(
+async def stream_response(
     llm: ChatOpenAI,
     messages: list[BaseMessage],
-) -> Iterator[str]:
-    for chunk in llm.stream(messages):
+    stream_to_stdout: bool = False,
+) -> AsyncIterator[str]:
+    async for chunk in llm.astream(messages):
         if hasattr(chunk, "content") and chunk.content:
             token = chunk.content
-            print(token, end="", flush=True)
+            if stream_to_stdout:
+                print(token, end="", flush=True)
             yield token
@@ -0,0 +1,22 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import List
+
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Process-pool workers import this module to load and split files, so it must stay free of
+# torch, faiss and sentence-transformers.
+
+
+@lru_cache(maxsize=None)
+def text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def load_and_split(path: Path, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    # Runs in worker processes, so it only takes picklable arguments and builds the
+    # splitter on the worker side.
+    documents = TextLoader(str(path)).load()
+    return text_splitter(chunk_size, chunk_overlap).split_documents(documents)
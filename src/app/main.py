@@ -1,15 +1,12 @@
+import asyncio
 import sys
 from pathlib import Path
 
 from loguru import logger
 
 from config import settings
-from app.graph import RAGGraph
 from logging_config import setup_logging
 from app.memory import SessionMemory
-from app.retrieval import DocumentRetriever
-
-setup_logging(level=settings.log_level)
 
 
 def display_retrieved_chunks(documents, scores) -> None:
@@ -31,6 +28,14 @@ def display_retrieved_chunks(documents, scores) -> None:
 
 
 def main() -> None:
+    # Imported here rather than at module scope: process-pool workers started with forkserver
+    # or spawn re-import __main__, and must not pay for torch/faiss or reconfigure logging.
+    from app.graph import RAGGraph
+    from app.retrieval import DocumentRetriever, configure_threads
+
+    setup_logging(level=settings.log_level)
+    configure_threads()
+
     print("=" * 70)
     print("AI Engineer Take-Home: RAG Application")
     print("=" * 70)
@@ -41,7 +46,7 @@ def main() -> None:
         project_root = Path(__file__).parent.parent
         data_dir = project_root / settings.retrieval.data_dir
         retriever = DocumentRetriever(data_dir=str(data_dir))
-        graph = RAGGraph(retriever=retriever)
+        graph = RAGGraph(retriever=retriever, stream_to_stdout=True)
         memory = SessionMemory()
 
         logger.info("Application initialized successfully")
@@ -57,6 +62,8 @@ def main() -> None:
     print("  quit / exit    - Exit the application")
     print()
 
+    runner = asyncio.Runner()
+
     while True:
         try:
             user_input = input("> ").strip()
@@ -88,7 +95,7 @@ def main() -> None:
 
             try:
                 logger.info(f"Processing query: {query}")
-                result = graph.invoke(query=query, messages=history)
+                result = runner.run(graph.ainvoke(query=query, messages=history))
 
                 retrieved_docs = result.get("retrieved_docs", [])
                 distances = result.get("distances", [])
@@ -121,6 +128,8 @@ def main() -> None:
             logger.exception(f"Unexpected error: {e}")
             print(f"\n[ERROR] Unexpected error: {e}\n")
 
+    runner.close()
+
 
 if __name__ == "__main__":
     main()
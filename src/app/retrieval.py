@@ -1,30 +1,485 @@
+import asyncio
+import hashlib
+import math
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property, partial
+from itertools import chain
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+import faiss
+import numpy as np
+import torch
+import torch.nn.functional as F
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from loguru import logger
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Transformer
+from transformers import AutoTokenizer, PreTrainedTokenizerFast
 
-from utils import handle_retrieval_error
+from config import settings
+from app.loading import load_and_split, text_splitter
+from utils import TTLCache, handle_retrieval_error
+
+# Let the Rust tokenizers use every core; set before the first tokenizer call. Explicitly
+# exported values (e.g. "false" in forked deployments) win.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
+
+def configure_threads() -> None:
+    # Size the FAISS (OpenMP) and PyTorch pools to the CPUs this process may run on: inside
+    # containers and cpusets the libraries' own defaults often count every host core.
+    num_threads = settings.retrieval.num_threads
+    if num_threads <= 0:
+        if hasattr(os, "sched_getaffinity"):
+            num_threads = len(os.sched_getaffinity(0))
+        else:
+            num_threads = os.cpu_count() or 1
+
+    # Libraries that read these at load time (MKL, child processes) follow the same size.
+    os.environ.setdefault("OMP_NUM_THREADS", str(num_threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(num_threads))
+    faiss.omp_set_num_threads(num_threads)
+    torch.set_num_threads(num_threads)
+    try:
+        # Encoder ops run one after another, so a single inter-op thread avoids oversubscription.
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed once, before PyTorch starts any inter-op work.
+        pass
+    logger.debug("Using {} threads for FAISS and PyTorch", num_threads)
+
+
+_MODEL_CACHE: dict[tuple[str, str, str], SentenceTransformer] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+_TORCH_DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+# Compiled encoders see padded lengths from this set only, so inductor reuses a few kernels
+# instead of specializing on every sequence length.
+_SEQUENCE_BUCKETS = (32, 64, 128, 256, 512)
+
+# Texts tokenized per tokenizer call when embedding documents. Token ids live in Python lists
+# (tens of bytes per token), so the whole corpus is never tokenized at once.
+_TOKENIZE_WINDOW = 8192
+
+_SCALAR_QUANTIZERS = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# int8 codes map each dimension's [min, max] seen in train() to 0..255. Widen that range so
+# chunks added later are not clipped, and keep float16 when there is too little to learn from.
+_INT8_RANGE_MARGIN = 0.1
+_MIN_INT8_TRAINING_VECTORS = 1000
+
+# FAISS warns below this many training points per k-means centroid.
+_MIN_POINTS_PER_CENTROID = 39
+
+# Bump when the persisted index layout or the way it is built changes.
+_INDEX_FORMAT_VERSION = 2
+
+# Persisted indexes are memory-mapped read-only, so every worker process shares one copy of
+# the vectors through the page cache. Older FAISS builds without IO_FLAG_MMAP_IFC read the
+# index into memory instead.
+_INDEX_READ_FLAGS = (
+    faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if hasattr(faiss, "IO_FLAG_MMAP_IFC") else 0
+)
+
+# Half-written index directories older than this were left behind by a crashed save.
+_STALE_INDEX_TMP_SECONDS = 3600
+
+
+def _cuda_has_native_bf16() -> bool:
+    # is_bf16_supported() also reports emulated BF16 on pre-Ampere GPUs, which is slower than
+    # FP16 there, so check the compute capability instead.
+    return torch.cuda.is_available() and torch.cuda.get_device_capability() >= (8, 0)
+
+
+def _resolve_precision(precision: str) -> str:
+    if precision == "auto":
+        # Half precision only pays off on tensor cores: BF16 on Ampere+, FP16 on older GPUs
+        # (V100, T4). Plain AVX2/AVX-512 CPUs emulate both, so 'auto' keeps FP32 there. Set
+        # 'bf16' explicitly on AMX hosts.
+        if _cuda_has_native_bf16():
+            return "bf16"
+        if torch.cuda.is_available():
+            return "fp16"
+        return "fp32"
+
+    if precision == "bf16" and not (
+        _cuda_has_native_bf16() or torch.backends.mkldnn.is_available()
+    ):
+        logger.warning("BF16 is not supported on this host, using FP32 embeddings")
+        return "fp32"
+
+    if precision == "fp16" and not torch.cuda.is_available():
+        logger.warning("FP16 embeddings need a CUDA device, using FP32 embeddings")
+        return "fp32"
+
+    return precision
+
+
+def _upcast_token_embeddings(module: torch.nn.Module, args: tuple, features: dict) -> dict:
+    # Pool and normalize in FP32: half-precision sums over long sequences lose precision.
+    return {**features, "token_embeddings": features["token_embeddings"].float()}
+
+
+def _load_onnx_model(model_name: str) -> SentenceTransformer:
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    quantization = settings.retrieval.onnx_quantization
+    cache_dir = Path(settings.retrieval.onnx_cache_dir).expanduser()
+    export_dir = cache_dir / model_name.replace("/", "__")
+    file_name = f"onnx/model_quantized_{quantization}.onnx"
+
+    if not (export_dir / file_name).exists():
+        logger.info(f"Exporting {model_name} to INT8 ONNX ({quantization}) in {export_dir}")
+        onnx_model = SentenceTransformer(model_name, backend="onnx")
+        onnx_model.save(str(export_dir))
+        export_dynamic_quantized_onnx_model(
+            onnx_model,
+            quantization,
+            str(export_dir),
+            file_suffix=f"quantized_{quantization}",
+        )
+
+    return SentenceTransformer(
+        str(export_dir),
+        backend="onnx",
+        model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"},
+    )
+
+
+def _load_torch_model(model_name: str, precision: str) -> SentenceTransformer:
+    if precision == "fp32":
+        # FP32 is the default; passing it anyway makes newer transformers warn on every load.
+        model = SentenceTransformer(model_name)
+    else:
+        model = SentenceTransformer(
+            model_name, model_kwargs={"torch_dtype": _TORCH_DTYPES[precision]}
+        )
+        model[0].register_forward_hook(_upcast_token_embeddings)
+    if settings.retrieval.embedding_compile and isinstance(model[0], Transformer):
+        # CUDA graphs ("reduce-overhead") only exist on GPU; inductor fusion helps on both.
+        mode = "reduce-overhead" if model.device.type == "cuda" else "default"
+        try:
+            model[0].auto_model = torch.compile(model[0].auto_model, mode=mode, dynamic=True)
+        except Exception as e:
+            logger.warning(f"torch.compile is unavailable, using the eager encoder: {e}")
+    return model
+
+
+def _ensure_fast_tokenizer(model: SentenceTransformer, model_name: str) -> None:
+    # Only the Rust ("fast") tokenizers batch in parallel; slow ones tokenize in Python.
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None or isinstance(tokenizer, PreTrainedTokenizerFast):
+        return
+
+    try:
+        fast_tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    except Exception as e:
+        logger.warning(f"Failed to load a fast tokenizer for {model_name}: {e}")
+        return
+
+    if isinstance(fast_tokenizer, PreTrainedTokenizerFast):
+        model.tokenizer = fast_tokenizer
+    else:
+        logger.warning(f"No fast tokenizer available for {model_name}, tokenizing in Python")
+
+
+def _load_model(
+    model_name: str, backend: str = "torch", precision: str = "fp32"
+) -> SentenceTransformer:
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get((model_name, backend, precision))
+        if model is None:
+            logger.info(
+                f"Loading embedding model: {model_name} (backend: {backend}, precision: {precision})"
+            )
+            if backend == "onnx":
+                try:
+                    model = _load_onnx_model(model_name)
+                except Exception as e:
+                    # optimum/onnxruntime are optional extras; keep serving with PyTorch.
+                    logger.exception(f"Failed to load ONNX model, falling back to PyTorch: {e}")
+                    model = _load_torch_model(model_name, precision)
+            else:
+                model = _load_torch_model(model_name, precision)
+            _ensure_fast_tokenizer(model, model_name)
+            _MODEL_CACHE[(model_name, backend, precision)] = model
+        return model
+
+
+def _inner_product_to_distance(scores: np.ndarray) -> np.ndarray:
+    # Every index ranks unit vectors by inner product. For unit vectors
+    # ||a - b||^2 = 2 - 2 * (a . b), so reporting that squared L2 distance keeps
+    # RETRIEVAL_DISTANCE_THRESHOLD on the same scale as the original IndexFlatL2.
+    return np.maximum(0.0, 2.0 - 2.0 * scores.astype(np.float64))
 
 
 class SentenceTransformerEmbeddings(Embeddings):
-    def __init__(self, model_name: str = "intfloat/e5-base-v2"):
+    def __init__(
+        self,
+        model_name: str = "intfloat/e5-base-v2",
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 3600.0,
+        cache_dir: Optional[Path] = None,
+        cache_max_files: int = 10_000,
+        batch_size: int = 64,
+        backend: str = "torch",
+        precision: str = "auto",
+    ):
         super().__init__()
-        logger.info(f"Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        # ONNX exports carry their own (INT8) weights; precision only applies to PyTorch.
+        self.precision = _resolve_precision(precision) if backend == "torch" else "fp32"
+        self.model = _load_model(model_name, backend, self.precision)
+        self.cache_dir = cache_dir
+        self.cache_max_files = cache_max_files
+        # Counted lazily on the first write, then kept up to date by this process.
+        self._disk_cache_files: Optional[int] = None
+        self._disk_cache_lock = threading.Lock()
+        self._disk_hits = 0
+        self.batch_size = batch_size
+        self._query_cache: TTLCache[np.ndarray] = TTLCache(
+            maxsize=query_cache_size, ttl=query_cache_ttl
+        )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = self.model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
-        return embeddings.tolist()
+        return self.encode_documents(texts).tolist()
+
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        # Returns the (n, dim) float32 matrix FAISS consumes directly, skipping the
+        # nested-list round trip of embed_documents().
+        if texts and self.model.backend == "torch" and isinstance(self.model[0], Transformer):
+            return self._encode_pretokenized(texts)
+
+        embeddings = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _encode_pretokenized(self, texts: List[str]) -> np.ndarray:
+        output = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), np.float32)
+        for start in range(0, len(texts), _TOKENIZE_WINDOW):
+            window = texts[start : start + _TOKENIZE_WINDOW]
+            output[start : start + len(window)] = self._encode_window(window)
+        return output
+
+    def _encode_window(self, texts: List[str]) -> np.ndarray:
+        module = self.model[0]
+        tokenizer = module.tokenizer
+        # Same preprocessing as Transformer.tokenize(), but one tokenizer call for the whole
+        # window; sub-batches are only padded, each to its own longest sequence.
+        texts = [text.strip() for text in texts]
+        if module.do_lower_case:
+            texts = [text.lower() for text in texts]
+        encoded = tokenizer(texts, truncation="longest_first", max_length=module.max_seq_length)
+        # Padding pre-tokenized ids is exactly what we want; silence the fast-tokenizer hint.
+        tokenizer.deprecation_warnings["Asking-to-pad-a-fast-tokenizer"] = True
+
+        # Longest first, like encode(), so each sub-batch carries as little padding as possible.
+        order = np.argsort([-len(ids) for ids in encoded["input_ids"]], kind="stable")
+        device = self.model.device
+        compiled = hasattr(module.auto_model, "_orig_mod")
+        output = torch.empty(
+            (len(texts), self.model.get_sentence_embedding_dimension()),
+            dtype=torch.float32,
+            device=device,
+        )
+
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                batch_order = order[start : start + self.batch_size]
+                padding = {}
+                if compiled:
+                    longest = len(encoded["input_ids"][batch_order[0]])
+                    bucket = next((b for b in _SEQUENCE_BUCKETS if b >= longest), longest)
+                    bucket = min(bucket, module.max_seq_length)
+                    padding = {"padding": "max_length", "max_length": bucket}
+                batch = tokenizer.pad(
+                    {key: [values[i] for i in batch_order] for key, values in encoded.items()},
+                    return_tensors="pt",
+                    **padding,
+                )
+                if device.type == "cuda":
+                    # Pinned (cached by PyTorch's host allocator) for async host-to-device copies.
+                    batch = {key: value.pin_memory() for key, value in batch.items()}
+                features = {
+                    key: value.to(device, non_blocking=True) for key, value in batch.items()
+                }
+                embeddings = self._forward(features)["sentence_embedding"].float()
+                output[torch.from_numpy(batch_order).to(device)] = F.normalize(embeddings, dim=1)
+
+        return output.cpu().numpy()
+
+    def _forward(self, features: dict[str, torch.Tensor]) -> dict[str, torch.Tensor]:
+        try:
+            return self.model(features)
+        except Exception as e:
+            # Compilation errors only surface on the first call; keep serving in eager mode.
+            auto_model = self.model[0].auto_model
+            if not hasattr(auto_model, "_orig_mod"):
+                raise
+            logger.warning(f"Compiled encoder failed, falling back to eager mode: {e}")
+            self.model[0].auto_model = auto_model._orig_mod
+            return self.model(features)
+
+    def warmup(self) -> None:
+        # Pays for lazy imports, kernel selection (or compilation) and allocator growth before
+        # the first request.
+        self.encode_documents(["warmup"])
 
     def embed_query(self, text: str) -> List[float]:
-        embedding = self.model.encode(text, show_progress_bar=False, normalize_embeddings=True)
-        return embedding.tolist()
+        return self.embed_query_vector(text).tolist()
+
+    def embed_query_vector(self, text: str) -> np.ndarray:
+        return self.embed_query_vectors([text])[0]
+
+    @cached_property
+    def _lowercase_queries(self) -> bool:
+        # Only fold case when the model does so anyway; cased models would embed differently.
+        return bool(
+            getattr(self.model[0], "do_lower_case", False)
+            or getattr(self.model.tokenizer, "do_lower_case", False)
+        )
+
+    def normalize_query(self, text: str) -> str:
+        # Whitespace runs and, for uncased models, letter case never reach the encoder, so
+        # queries differing only in those share one cache entry.
+        text = " ".join(text.split())
+        return text.lower() if self._lowercase_queries else text
+
+    def embed_query_vectors(self, texts: List[str]) -> np.ndarray:
+        texts = [self.normalize_query(text) for text in texts]
+        vectors: dict[str, np.ndarray] = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            embedding = self._query_cache.get(text)
+            if embedding is None:
+                embedding = self._load_cached_embedding(text)
+                if embedding is not None:
+                    self._disk_hits += 1
+                    self._remember_query(text, embedding)
+            if embedding is None:
+                missing.append(text)
+            else:
+                vectors[text] = embedding
+
+        if missing:
+            # One forward pass for every query that is not cached yet.
+            encoded = self.encode_documents(missing)
+            for text, embedding in zip(missing, encoded):
+                embedding = embedding.copy()
+                self._store_cached_embedding(text, embedding)
+                self._remember_query(text, embedding)
+                vectors[text] = embedding
+
+        return np.stack([vectors[text] for text in texts])
+
+    def _remember_query(self, text: str, embedding: np.ndarray) -> None:
+        # Cached arrays are shared between callers, so guard them against in-place edits.
+        embedding.flags.writeable = False
+        self._query_cache.set(text, embedding)
+
+    def _cache_path(self, text: str) -> Path:
+        # The model, runtime and precision are part of the key so switching any of them never
+        # serves stale vectors (INT8/BF16 embeddings differ slightly from FP32 ones).
+        namespace = f"{self.model_name}@{self.model.backend}:{self.precision}"
+        digest = hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{digest}.npy"
+
+    def _load_cached_embedding(self, text: str) -> Optional[np.ndarray]:
+        if self.cache_dir is None:
+            return None
+
+        path = self._cache_path(text)
+        if not path.exists():
+            return None
+
+        try:
+            embedding = np.load(path)
+        except Exception as e:
+            logger.warning("Failed to read cached embedding {}: {}", path.name, e)
+            return None
+
+        try:
+            # Reads refresh the mtime, so pruning evicts the least recently used entries.
+            os.utime(path)
+        except OSError:
+            pass
+        return embedding
+
+    def _store_cached_embedding(self, text: str, embedding: np.ndarray) -> None:
+        if self.cache_dir is None:
+            return
+
+        path = self._cache_path(text)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding)
+            # Atomic rename so concurrent workers never observe a partially written file.
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Failed to write cached embedding {}: {}", path.name, e)
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self._disk_cache_lock:
+            if self._disk_cache_files is None:
+                self._disk_cache_files = sum(1 for _ in self.cache_dir.glob("*.npy"))
+            else:
+                self._disk_cache_files += 1
+            if self._disk_cache_files > self.cache_max_files:
+                self._prune_disk_cache()
+
+    def _prune_disk_cache(self) -> None:
+        # Every worker writes into the same directory, so recount from disk before pruning.
+        entries = []
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+
+        # Trim to 90% of the cap so pruning runs once per batch of new entries, not per write.
+        excess = max(0, len(entries) - int(self.cache_max_files * 0.9))
+        entries.sort()
+        for _, path in entries[:excess]:
+            path.unlink(missing_ok=True)
+        self._disk_cache_files = len(entries) - excess
+        logger.debug("Pruned {} cached query embeddings", excess)
+
+    def query_cache_stats(self) -> dict:
+        hits, disk_hits = self._query_cache.hits, self._disk_hits
+        # In-memory misses that were found on disk did not need the encoder.
+        misses = self._query_cache.misses - disk_hits
+        lookups = hits + disk_hits + misses
+        return {
+            "query_cache_hits": hits,
+            "query_disk_cache_hits": disk_hits,
+            "query_cache_misses": misses,
+            "query_cache_hit_rate": round((hits + disk_hits) / lookups, 4) if lookups else 0.0,
+        }
 
 
 class DocumentRetriever:
@@ -35,16 +490,74 @@ class DocumentRetriever:
         chunk_overlap: int = 120,
         embedding_model: str = "intfloat/e5-base-v2",
         similarity_top_k: int = 2,
+        query_cache_size: Optional[int] = None,
+        embedding_disk_cache: Optional[bool] = None,
     ):
         self.data_dir = Path(data_dir)
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # Shared with the in-process loading path through the text_splitter() cache.
+        self._splitter = text_splitter(chunk_size, chunk_overlap)
         self.similarity_top_k = similarity_top_k
         self.embedding_model = embedding_model
+        self.query_cache_size = (
+            query_cache_size
+            if query_cache_size is not None
+            else settings.retrieval.query_cache_size
+        )
+        if embedding_disk_cache is None:
+            embedding_disk_cache = settings.retrieval.embedding_disk_cache
+        # Kept out of data_dir: entries are created per distinct query, not per corpus file.
+        self.embedding_cache_dir = (
+            Path(settings.retrieval.embedding_cache_dir).expanduser()
+            if embedding_disk_cache
+            else None
+        )
+        self.index_cache_dir = self.data_dir / "index" if settings.retrieval.index_cache else None
 
-        self.embeddings = SentenceTransformerEmbeddings(model_name=embedding_model)
-        self.vector_store: FAISS | None = None
-        self._initialize_vector_store()
+        # The encoder and the index are only built on first use, so constructing a retriever
+        # (worker boot, health checks) stays cheap.
+        self._embeddings: SentenceTransformerEmbeddings | None = None
+        self._embeddings_lock = threading.Lock()
+        self._vector_store: FAISS | None = None
+        self._vector_store_lock = threading.Lock()
+        self._sources: set[str] = set()
+        self._index_read_only = False
+        self._gpu_resources = None
+        self._results_cache: TTLCache[Tuple[List[Document], List[float]]] = TTLCache(
+            maxsize=settings.retrieval.results_cache_size,
+            ttl=settings.retrieval.query_cache_ttl,
+        )
+        self._index_generation = 0
+
+    @property
+    def embeddings(self) -> SentenceTransformerEmbeddings:
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    self._embeddings = SentenceTransformerEmbeddings(
+                        model_name=self.embedding_model,
+                        query_cache_size=self.query_cache_size,
+                        query_cache_ttl=settings.retrieval.query_cache_ttl,
+                        cache_dir=self.embedding_cache_dir,
+                        cache_max_files=settings.retrieval.embedding_disk_cache_max_files,
+                        batch_size=settings.retrieval.embedding_batch_size,
+                        backend=settings.retrieval.embedding_backend,
+                        precision=settings.retrieval.embedding_precision,
+                    )
+        return self._embeddings
+
+    @property
+    def vector_store(self) -> FAISS:
+        if self._vector_store is None:
+            with self._vector_store_lock:
+                if self._vector_store is None:
+                    self._initialize_vector_store()
+        return self._vector_store
+
+    def warmup(self) -> None:
+        self.embeddings.warmup()
+        logger.info(f"Vector store ready with {self.vector_store.index.ntotal} chunks")
 
     def _initialize_vector_store(self) -> None:
         try:
@@ -52,99 +565,437 @@ class DocumentRetriever:
                 logger.warning(
                     f"Data directory {self.data_dir} does not exist. Creating empty vector store."
                 )
-                self.vector_store = FAISS.from_texts([""], self.embeddings)
+                self._vector_store = self._build_vector_store([Document(page_content="")])
                 return
 
-            logger.info(f"Loading documents from {self.data_dir}")
-            loader = DirectoryLoader(
-                str(self.data_dir),
-                glob="**/*.md",
-                loader_cls=TextLoader,
-                show_progress=False,
+            files = sorted(
+                path
+                for path in self.data_dir.glob("**/*.md")
+                if path.is_file()
+                and not any(part.startswith(".") for part in path.relative_to(self.data_dir).parts)
             )
-            documents = loader.load()
 
-            if not documents:
+            if not files:
                 logger.warning(f"No documents found in {self.data_dir}")
-                self.vector_store = FAISS.from_texts([""], self.embeddings)
+                self._vector_store = self._build_vector_store([Document(page_content="")])
                 return
 
-            logger.info(f"Loaded {len(documents)} documents")
+            cache_path = self._index_cache_path(files)
+            if cache_path is not None and (cache_path / "index.faiss").exists():
+                try:
+                    self._vector_store = self._load_vector_store(cache_path)
+                    self._track_sources(list(self._vector_store.docstore._dict.values()))
+                    logger.info(
+                        "Loaded persisted vector store ({} chunks) from {}",
+                        self._vector_store.index.ntotal,
+                        cache_path,
+                    )
+                    return
+                except Exception as e:
+                    logger.warning(f"Failed to load persisted vector store, rebuilding: {e}")
 
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap,
-            )
-            splits = text_splitter.split_documents(documents)
-            logger.info(f"Split into {len(splits)} chunks")
+            logger.info("Loading {} documents from {}", len(files), self.data_dir)
+            splits = self._load_and_split_files(files)
+            if not splits:
+                logger.warning(f"Documents in {self.data_dir} are empty")
+                self._vector_store = self._build_vector_store([Document(page_content="")])
+                return
+
+            logger.info("Split into {} chunks", len(splits))
+            self._track_sources(splits)
 
             logger.info("Creating FAISS vector store...")
-            self.vector_store = FAISS.from_documents(splits, self.embeddings)
+            self._vector_store = self._build_vector_store(splits)
             logger.info("Vector store initialized successfully")
 
+            if cache_path is not None:
+                self._save_vector_store(cache_path)
+
         except Exception as e:
             logger.exception(f"Failed to initialize vector store: {e}")
-            self.vector_store = FAISS.from_texts([""], self.embeddings)
+            self._sources.clear()
+            self._vector_store = self._build_vector_store([Document(page_content="")])
+
+    def _index_cache_path(self, files: List[Path]) -> Optional[Path]:
+        if self.index_cache_dir is None:
+            return None
+
+        # Any change to the corpus, the chunking, the encoder or the index layout
+        # produces a new key, so a stale index is never loaded.
+        retrieval = settings.retrieval
+        config = (
+            _INDEX_FORMAT_VERSION,
+            self.chunk_size,
+            self.chunk_overlap,
+            self.embedding_model,
+            self.embeddings.model.backend,
+            self.embeddings.precision,
+            retrieval.index_type,
+            retrieval.index_precision,
+            retrieval.hnsw_min_chunks,
+            retrieval.hnsw_m,
+            retrieval.hnsw_ef_construction,
+            retrieval.hnsw_ef_search,
+            retrieval.ivfpq_min_chunks,
+            retrieval.ivf_nprobe,
+            self._use_gpu_index,
+        )
+        digest = hashlib.blake2b(repr(config).encode("utf-8"), digest_size=16)
+        for path in files:
+            digest.update(path.relative_to(self.data_dir).as_posix().encode("utf-8") + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+        return self.index_cache_dir / digest.hexdigest()
+
+    def _load_vector_store(self, path: Path) -> FAISS:
+        # Same layout as FAISS.save_local(); read by hand so the index can be memory-mapped.
+        cpu_index = faiss.read_index(str(path / "index.faiss"), _INDEX_READ_FLAGS)
+        with open(path / "index.pkl", "rb") as f:
+            # Only ever written by _save_vector_store() for this data directory.
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        try:
+            # Loads refresh the mtime, so pruning evicts the least recently used entries.
+            os.utime(path)
+        except OSError:
+            pass
+
+        index = self._index_to_device(cpu_index)
+        self._index_read_only = index is cpu_index and _INDEX_READ_FLAGS != 0
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
+    def _save_vector_store(self, path: Path) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+            # Same layout as FAISS.save_local(), but GPU indexes are written as their CPU copy.
+            index = self._vector_store.index
+            cpu_index = faiss.index_gpu_to_cpu(index) if self._use_gpu_index else index
+            faiss.write_index(cpu_index, str(tmp_path / "index.faiss"))
+            with open(tmp_path / "index.pkl", "wb") as f:
+                pickle.dump(
+                    (self._vector_store.docstore, self._vector_store.index_to_docstore_id), f
+                )
+            try:
+                # Atomic rename so concurrent workers never load a partially written index.
+                os.replace(tmp_path, path)
+            except OSError:
+                # Another worker persisted the same index first.
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+
+            logger.info(f"Persisted vector store to {path}")
+            self._prune_index_cache(path)
+        except Exception as e:
+            logger.warning(f"Failed to persist vector store to {path}: {e}")
+
+    def _prune_index_cache(self, current: Path) -> None:
+        # Processes with different settings (the CLI and the API, two deploy versions) can share
+        # data_dir, so keep the most recently used entries instead of only the current one.
+        now = time.time()
+        entries = []
+        for entry in current.parent.iterdir():
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(".tmp-"):
+                # Recent ones may still be being written by another worker.
+                if now - mtime > _STALE_INDEX_TMP_SECONDS:
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif entry != current and entry.is_dir():
+                entries.append((mtime, entry))
+
+        entries.sort(reverse=True)
+        keep = max(0, settings.retrieval.index_cache_max_entries - 1)
+        for _, stale in entries[keep:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+    def _load_and_split_files(self, files: List[Path]) -> List[Document]:
+        load = partial(load_and_split, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        # Splitting runs at roughly 10 MB/s per core, while starting the pool costs about a
+        # second, so only large corpora on multi-core hosts are worth spreading over processes.
+        max_workers = settings.retrieval.load_workers or os.cpu_count() or 1
+        total_bytes = sum(path.stat().st_size for path in files)
+        if max_workers < 2 or total_bytes < settings.retrieval.parallel_load_min_bytes:
+            return list(chain.from_iterable(map(load, files)))
+
+        # Workers start from a clean interpreter (forkserver, or spawn where it is unavailable)
+        # instead of forking a process that already runs the encoder and tokenizer threads.
+        method = (
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context(method)
+        ) as executor:
+            return list(chain.from_iterable(executor.map(load, files, chunksize=4)))
+
+    def _track_sources(self, documents: List[Document]) -> None:
+        # Kept up to date on every insert so /stats never has to walk the docstore.
+        self._sources.update(
+            source
+            for source in (doc.metadata.get("source") for doc in documents)
+            if source and source != "unknown"
+        )
+
+    @cached_property
+    def _use_gpu_index(self) -> bool:
+        device = settings.retrieval.index_device
+        if device == "cpu":
+            return False
+
+        # faiss-cpu builds have no GPU symbols and report zero GPUs.
+        available = (
+            hasattr(faiss, "StandardGpuResources")
+            and torch.cuda.is_available()
+            and faiss.get_num_gpus() > 0
+        )
+        if device == "cuda" and not available:
+            logger.warning("No CUDA device or GPU build of FAISS available, using a CPU index")
+        return available
+
+    def _index_to_device(self, index: faiss.Index) -> faiss.Index:
+        if not self._use_gpu_index:
+            return index
+
+        try:
+            # Flat vectors and IVF-PQ lookup tables are kept in float16 on the GPU as well.
+            if faiss.get_num_gpus() > 1:
+                options = faiss.GpuMultipleClonerOptions()
+                options.useFloat16 = True
+                gpu_index = faiss.index_cpu_to_all_gpus(index, co=options)
+            else:
+                if self._gpu_resources is None:
+                    self._gpu_resources = faiss.StandardGpuResources()
+                options = faiss.GpuClonerOptions()
+                options.useFloat16 = True
+                gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, index, options)
+        except Exception as e:
+            # Not every index type has a GPU implementation (HNSW does not).
+            logger.warning(f"Failed to move FAISS index to GPU, searching on CPU: {e}")
+            return index
+
+        logger.info(f"Moved FAISS index to {faiss.get_num_gpus()} GPU(s)")
+        return gpu_index
+
+    def _create_index(self, dimension: int, num_vectors: int) -> faiss.Index:
+        index_type = settings.retrieval.index_type
+        if index_type == "auto":
+            if num_vectors >= settings.retrieval.ivfpq_min_chunks:
+                index_type = "ivfpq"
+            elif num_vectors >= settings.retrieval.hnsw_min_chunks:
+                index_type = "hnsw"
+            else:
+                index_type = "flat"
+
+        nlist = int(4 * math.sqrt(num_vectors))
+        if index_type == "ivfpq" and num_vectors < _MIN_POINTS_PER_CENTROID * max(nlist, 256):
+            # k-means for the coarse lists and the 256-entry PQ codebooks needs enough
+            # training points, otherwise recall collapses (or training fails outright).
+            logger.warning(
+                f"Not enough chunks ({num_vectors}) to train an IVF-PQ index, using flat instead"
+            )
+            index_type = "flat"
+
+        # Flat and HNSW indexes store vectors as float16 (half the memory and bytes scanned per
+        # search compared to IndexFlatL2) or, opt-in, as int8 with a per-dimension range learned
+        # in train() (a quarter). Distances are still reported in float32.
+        # Embeddings are L2-normalized, so inner product ranks exactly like L2 distance
+        # while skipping the subtraction in the distance kernel.
+        precision = settings.retrieval.index_precision
+        if precision == "int8" and num_vectors < _MIN_INT8_TRAINING_VECTORS:
+            logger.info(f"Too few chunks ({num_vectors}) to learn int8 ranges, storing float16")
+            precision = "fp16"
+
+        quantizer_type = _SCALAR_QUANTIZERS[precision]
+        if index_type == "ivfpq":
+            # Roughly 8 dimensions per 1-byte sub-quantizer code; m must divide the dimension.
+            m = max(1, dimension // 8)
+            while dimension % m:
+                m -= 1
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = min(settings.retrieval.ivf_nprobe, nlist)
+        elif index_type == "hnsw":
+            index = faiss.IndexHNSWSQ(
+                dimension,
+                quantizer_type,
+                settings.retrieval.hnsw_m,
+                faiss.METRIC_INNER_PRODUCT,
+            )
+            index.hnsw.efConstruction = settings.retrieval.hnsw_ef_construction
+            index.hnsw.efSearch = settings.retrieval.hnsw_ef_search
+            faiss.downcast_index(index.storage).sq.rangestat_arg = _INT8_RANGE_MARGIN
+        elif self._use_gpu_index:
+            # GPU FAISS has no flat scalar-quantizer index; its flat index stores float16 itself.
+            index = faiss.IndexFlatIP(dimension)
+        else:
+            index = faiss.IndexScalarQuantizer(
+                dimension, quantizer_type, faiss.METRIC_INNER_PRODUCT
+            )
+            index.sq.rangestat_arg = _INT8_RANGE_MARGIN
+
+        logger.info(f"Created FAISS {index_type} index for {num_vectors} vectors (dim={dimension})")
+        return index
+
+    def _build_vector_store(self, documents: List[Document]) -> FAISS:
+        vectors = self.embeddings.encode_documents([doc.page_content for doc in documents])
+
+        index = self._index_to_device(self._create_index(vectors.shape[1], vectors.shape[0]))
+        if not index.is_trained:
+            index.train(vectors)
+
+        vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+        self._add_vectors(vector_store, documents, vectors)
+        return vector_store
+
+    @staticmethod
+    def _add_vectors(vector_store: FAISS, documents: List[Document], vectors: np.ndarray) -> None:
+        # Mirrors FAISS.add_embeddings() but hands the float32 matrix straight to the index.
+        ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        start = vector_store.index.ntotal
+        vector_store.index.add(vectors)
+        vector_store.docstore.add(
+            {
+                doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+                for doc_id, doc in zip(ids, documents)
+            }
+        )
+        vector_store.index_to_docstore_id.update(
+            {start + i: doc_id for i, doc_id in enumerate(ids)}
+        )
 
     @handle_retrieval_error
     def get_relevant_documents(
         self, query: str, k: int | None = None
     ) -> Tuple[List[Document], List[float]]:
+        return self.get_relevant_documents_batch([query], k=k)[0]
+
+    def get_relevant_documents_batch(
+        self, queries: List[str], k: int | None = None
+    ) -> List[Tuple[List[Document], List[float]]]:
         if k is None:
             k = self.similarity_top_k
 
-        if self.vector_store is None:
-            logger.warning("Vector store not initialized. Returning empty results.")
-            return [], []
+        keys = [(self.embeddings.normalize_query(query), k) for query in queries]
+        # Equivalent queries in one batch share a single cache lookup and search.
+        results = {key: self._results_cache.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, result in results.items() if result is None]
+        if missing:
+            generation = self._index_generation
+            searched = self._search([query for query, _ in missing], k)
+            for key, result in zip(missing, searched):
+                results[key] = result
+                # Skip caching results computed while add_documents() was changing the index.
+                if generation == self._index_generation:
+                    self._results_cache.set(key, result)
 
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        # Hand out copies so callers cannot mutate cached entries.
+        return [(list(results[key][0]), list(results[key][1])) for key in keys]
 
-        if not results:
-            logger.warning(f"No results found for query: {query[:50]}...")
-            return [], []
+    def _search(self, queries: List[str], k: int) -> List[Tuple[List[Document], List[float]]]:
+        query_vectors = self.embeddings.embed_query_vectors(queries)
+        # A single search call lets FAISS spread the queries over its OpenMP threads.
+        scores, indices = self.vector_store.index.search(query_vectors, k)
+        all_distances = _inner_product_to_distance(scores).tolist()
 
-        documents, distances = zip(*results)
+        results = []
+        for query, query_distances, query_indices in zip(queries, all_distances, indices):
+            documents, distances = [], []
+            for distance, i in zip(query_distances, query_indices):
+                if i == -1:
+                    continue
+                doc = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[i])
+                if not isinstance(doc, Document):
+                    continue
+                documents.append(doc)
+                distances.append(distance)
 
-        logger.info(
-            f"Retrieved {len(documents)} documents for query: {query[:50]}... "
-            f"(min distance: {min(distances):.3f})"
-        )
+            if documents:
+                logger.info(
+                    "Retrieved {} documents for query: {}... (min distance: {:.3f})",
+                    len(documents),
+                    query[:50],
+                    distances[0],
+                )
+            else:
+                logger.warning("No results found for query: {}...", query[:50])
+            results.append((documents, distances))
 
-        return list(documents), list(distances)
+        return results
 
-    def add_documents(self, documents: List[Document]) -> None:
+    def add_documents(self, documents: List[Document], pre_split: bool = False) -> None:
         if not documents:
             logger.warning("No documents provided to add")
             return
 
-        if self.vector_store is None:
-            logger.info("Vector store not initialized. Creating new one...")
-            self.vector_store = FAISS.from_documents(documents, self.embeddings)
-            logger.info(f"Created vector store with {len(documents)} documents")
-            return
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-        )
-        splits = text_splitter.split_documents(documents)
-        logger.info(f"Split {len(documents)} documents into {len(splits)} chunks")
+        if pre_split:
+            # Callers that chunked upstream skip a second pass over every separator regex.
+            splits = documents
+        else:
+            splits = self._splitter.split_documents(documents)
+            logger.info("Split {} documents into {} chunks", len(documents), len(splits))
 
         try:
-            self.vector_store.add_documents(splits)
-            logger.info(f"Successfully added {len(splits)} chunks to vector store")
+            if self._index_read_only:
+                # Memory-mapped indexes cannot grow; take a private, writable copy first.
+                index = self.vector_store.index
+                self.vector_store.index = faiss.deserialize_index(faiss.serialize_index(index))
+                self._index_read_only = False
+            vectors = self.embeddings.encode_documents([doc.page_content for doc in splits])
+            self._add_vectors(self.vector_store, splits, vectors)
+            self._track_sources(splits)
+            # New chunks can change any query's top-k.
+            self._index_generation += 1
+            self._results_cache.clear()
+            logger.info("Successfully added {} chunks to vector store", len(splits))
         except Exception as e:
             logger.exception(f"Failed to add documents: {e}")
             raise
 
+    def _cache_stats(self) -> dict:
+        if self._embeddings is None:
+            stats = {
+                "query_cache_hits": 0,
+                "query_disk_cache_hits": 0,
+                "query_cache_misses": 0,
+                "query_cache_hit_rate": 0.0,
+            }
+        else:
+            stats = self._embeddings.query_cache_stats()
+
+        # Repeated queries are answered by the results cache before they reach the embedding
+        # cache, so both are reported.
+        hits, misses = self._results_cache.hits, self._results_cache.misses
+        lookups = hits + misses
+        return {
+            **stats,
+            "results_cache_hits": hits,
+            "results_cache_misses": misses,
+            "results_cache_hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
     def get_stats(self) -> dict:
-        if self.vector_store is None:
+        # Stats never trigger the lazy initialization: polling /stats must stay cheap.
+        if self._vector_store is None:
             return {
                 "status": "not_initialized",
                 "documents": 0,
                 "total_chunks": 0,
                 "embedding_model": self.embedding_model,
                 "context_top_k": self.similarity_top_k,
+                **self._cache_stats(),
             }
 
         try:
@@ -154,15 +1005,7 @@ class DocumentRetriever:
             if hasattr(self.vector_store, "index") and self.vector_store.index.ntotal > 0:
                 total_chunks = self.vector_store.index.ntotal
 
-                if hasattr(self.vector_store, "docstore") and self.vector_store.docstore:
-                    sources = set()
-                    for doc_id in self.vector_store.docstore._dict.keys():
-                        doc = self.vector_store.docstore.search(doc_id)
-                        if doc and hasattr(doc, "metadata") and "source" in doc.metadata:
-                            source = doc.metadata["source"]
-                            if source and source != "unknown":
-                                sources.add(source)
-                    documents = len(sources)
+                documents = len(self._sources)
 
                 if documents == 0 and self.data_dir.exists():
                     md_files = list(self.data_dir.glob("**/*.md"))
@@ -174,6 +1017,7 @@ class DocumentRetriever:
                     "total_chunks": total_chunks,
                     "embedding_model": self.embedding_model,
                     "context_top_k": self.similarity_top_k,
+                    **self._cache_stats(),
                 }
 
             return {
@@ -182,6 +1026,7 @@ class DocumentRetriever:
                 "total_chunks": 0,
                 "embedding_model": self.embedding_model,
                 "context_top_k": self.similarity_top_k,
+                **self._cache_stats(),
             }
         except Exception as e:
             logger.exception(f"Failed to get stats: {e}")
@@ -191,5 +1036,79 @@ class DocumentRetriever:
                 "total_chunks": 0,
                 "embedding_model": self.embedding_model,
                 "context_top_k": self.similarity_top_k,
+                **self._cache_stats(),
                 "error": str(e),
             }
+
+
+class BatchingRetriever:
+    """Coalesces concurrent queries into one encoder pass and one FAISS search."""
+
+    def __init__(
+        self,
+        retriever: DocumentRetriever,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+    ):
+        self.retriever = retriever
+        self.max_batch_size = (
+            max_batch_size if max_batch_size is not None else settings.retrieval.batch_max_size
+        )
+        self.max_wait = (
+            max_wait_ms if max_wait_ms is not None else settings.retrieval.batch_max_wait_ms
+        ) / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def get_relevant_documents(
+        self, query: str, k: int | None = None
+    ) -> Tuple[List[Document], List[float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self._get_queue(loop).put((query, k, future))
+        return await future
+
+    def _get_queue(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        # Queues and tasks belong to one event loop; start a fresh worker if the caller
+        # runs on a different loop (e.g. a new asyncio.run() per CLI session or test).
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        # A single worker: one batch is retrieved at a time while the next one collects. The
+        # encoder and FAISS already use every core, so overlapping batches would only contend.
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._process(batch)
+
+    async def _process(self, batch: list) -> None:
+        queries = [query for query, _, _ in batch]
+        ks = [k if k is not None else self.retriever.similarity_top_k for _, k, _ in batch]
+        logger.debug("Retrieving a batch of {} queries", len(batch))
+
+        try:
+            results = await asyncio.to_thread(
+                self.retriever.get_relevant_documents_batch, queries, k=max(ks)
+            )
+        except Exception as e:
+            logger.exception(f"Retrieval error in batch of {len(batch)} queries: {e}")
+            results = [([], []) for _ in batch]
+
+        for (_, _, future), k, (documents, distances) in zip(batch, ks, results):
+            # The caller may have been cancelled (e.g. a client disconnect) while waiting.
+            if not future.done():
+                future.set_result((documents[:k], distances[:k]))
@@ -1,5 +1,7 @@
 import enum
+from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic import Field
@@ -38,6 +40,22 @@ class OpenRouterSettings(BaseSettings):
         default="https://openrouter.ai/api/v1",
         description="OpenRouter base URL",
     )
+    max_connections: int = Field(
+        default=100,
+        description="Maximum concurrent HTTP connections to OpenRouter",
+    )
+    max_keepalive_connections: int = Field(
+        default=20,
+        description="Idle HTTP connections kept open for reuse",
+    )
+    answer_cache_size: int = Field(
+        default=512,
+        description="Number of generated answers cached for repeated questions (0 disables)",
+    )
+    answer_cache_ttl: float = Field(
+        default=3600,
+        description="Seconds a cached answer stays valid",
+    )
 
 
 class RetrievalSettings(BaseSettings):
@@ -54,6 +72,118 @@ class RetrievalSettings(BaseSettings):
         default=0.9,
         description="Distance threshold for retrieval",
     )
+    embedding_backend: Literal["torch", "onnx"] = Field(
+        default="torch",
+        description="Encoder runtime; 'onnx' runs a dynamically INT8-quantized ONNX export",
+    )
+    embedding_precision: Literal["auto", "fp32", "bf16", "fp16"] = Field(
+        default="auto",
+        description="Encoder weight precision for the torch backend; 'auto' uses bf16/fp16 on GPUs",
+    )
+    embedding_compile: bool = Field(
+        default=False,
+        description="Compile the PyTorch encoder with torch.compile (slow first calls)",
+    )
+    onnx_quantization: Literal["arm64", "avx2", "avx512", "avx512_vnni"] = Field(
+        default="avx512_vnni",
+        description="Target CPU instruction set for the INT8 ONNX export",
+    )
+    onnx_cache_dir: str = Field(
+        default="~/.cache/rag-onnx",
+        description="Directory holding quantized ONNX exports of the embedding model",
+    )
+    num_threads: int = Field(
+        default=0,
+        description="Threads for FAISS search and the PyTorch encoder (0 = CPUs available)",
+    )
+    embedding_batch_size: int = Field(
+        default=64,
+        description="Batch size used when embedding document chunks",
+    )
+    query_cache_size: int = Field(
+        default=1024,
+        description="Number of query embeddings kept in the in-process LRU cache",
+    )
+    query_cache_ttl: float = Field(
+        default=3600.0,
+        description="Seconds before cached query embeddings and retrieval results expire",
+    )
+    results_cache_size: int = Field(
+        default=1024,
+        description="Number of (query, k) retrieval results kept in memory",
+    )
+    embedding_disk_cache: bool = Field(
+        default=False,
+        description="Persist query embeddings under embedding_cache_dir",
+    )
+    embedding_cache_dir: str = Field(
+        default="~/.cache/rag-embeddings",
+        description="Directory holding persisted query embeddings",
+    )
+    embedding_disk_cache_max_files: int = Field(
+        default=10_000,
+        description="Persisted query embeddings kept before the least recently used are pruned",
+    )
+    index_cache: bool = Field(
+        default=True,
+        description="Persist the FAISS index under <data_dir>/index and reuse it on startup",
+    )
+    index_cache_max_entries: int = Field(
+        default=4,
+        description="Persisted indexes kept before the least recently used are pruned",
+    )
+    parallel_load_min_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Minimum corpus size in bytes before loading/splitting uses a process pool",
+    )
+    load_workers: int = Field(
+        default=0,
+        description="Worker processes for loading and splitting documents (0 = one per CPU core)",
+    )
+    batch_max_size: int = Field(
+        default=32,
+        description="Maximum number of concurrent queries retrieved in one batch",
+    )
+    batch_max_wait_ms: float = Field(
+        default=5.0,
+        description="How long the first query in a batch waits for others to join, in ms",
+    )
+    index_type: Literal["auto", "flat", "hnsw", "ivfpq"] = Field(
+        default="auto",
+        description="FAISS index type; 'auto' moves to HNSW, then IVF-PQ, as the corpus grows",
+    )
+    hnsw_min_chunks: int = Field(
+        default=10_000,
+        description="Minimum number of chunks for 'auto' to pick an HNSW index",
+    )
+    hnsw_m: int = Field(
+        default=32,
+        description="Number of HNSW graph neighbours per node",
+    )
+    hnsw_ef_construction: int = Field(
+        default=200,
+        description="HNSW candidate list size while building the index",
+    )
+    hnsw_ef_search: int = Field(
+        default=64,
+        description="HNSW candidate list size at query time",
+    )
+    index_precision: Literal["fp16", "int8"] = Field(
+        default="fp16",
+        description="Storage precision of vectors in flat and HNSW indexes",
+    )
+    index_device: Literal["auto", "cpu", "cuda"] = Field(
+        default="auto",
+        description="Where FAISS searches; 'auto' uses the GPU with CUDA and a GPU build of FAISS",
+    )
+    ivfpq_min_chunks: int = Field(
+        default=1_000_000,
+        description="Minimum number of chunks for 'auto' to pick an IVF-PQ index",
+    )
+    ivf_nprobe: int = Field(
+        default=16,
+        description="Number of IVF lists scanned per query",
+    )
 
     @property
     def data_dir_path(self) -> Path:
@@ -78,6 +208,10 @@ class APISettings(BaseSettings):
         default=True,
         description="Reload server when code changes",
     )
+    workers: int = Field(
+        default=1,
+        description="Number of Uvicorn worker processes (ignored when reload is enabled)",
+    )
 
 
 class Settings(BaseSettings):
@@ -94,13 +228,19 @@ class Settings(BaseSettings):
         description="Base directory of the project",
     )
 
-    openrouter: OpenRouterSettings = OpenRouterSettings()
-    retrieval: RetrievalSettings = RetrievalSettings()
-    api: APISettings = APISettings()
+    # Factories so the sub-settings read the environment when Settings is built, not at import.
+    openrouter: OpenRouterSettings = Field(default_factory=OpenRouterSettings)
+    retrieval: RetrievalSettings = Field(default_factory=RetrievalSettings)
+    api: APISettings = Field(default_factory=APISettings)
 
     @property
     def openrouter_base_url(self) -> str:
         return self.openrouter.base_url
 
 
-settings = Settings()  # type: ignore
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()  # type: ignore
+
+
+settings = get_settings()
@@ -6,7 +6,7 @@ from loguru import logger
 _logging_configured = False
 
 
-def setup_logging(level: Optional[str] = None) -> None:
+def setup_logging(level: Optional[str] = None, enqueue: bool = False) -> None:
     global _logging_configured
 
     if _logging_configured:
@@ -22,6 +22,9 @@ def setup_logging(level: Optional[str] = None) -> None:
         format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
         level=level,
         colorize=True,
+        # The API writes from a background thread so request handlers never block on stdout; the
+        # CLI stays synchronous so log lines do not land inside streamed answers.
+        enqueue=enqueue,
     )
 
     logger.disable("httpx")
@@ -1,10 +1,61 @@
+import asyncio
+import inspect
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
-from typing import Any, Callable, TypeVar, cast
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar, cast
 
 from loguru import logger
 
 T = TypeVar("T")
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after insertion."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
 
 
 def retry_with_backoff(
@@ -14,6 +65,34 @@ def retry_with_backoff(
     exceptions: tuple[type[Exception], ...] = (Exception,),
 ) -> Callable[[Callable[..., T]], Callable[..., T]]:
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                delay = initial_delay
+                last_exception = None
+
+                for attempt in range(max_retries + 1):
+                    try:
+                        return await func(*args, **kwargs)
+                    except exceptions as e:
+                        last_exception = e
+                        if attempt < max_retries:
+                            logger.warning(
+                                f"Attempt {attempt + 1}/{max_retries + 1} failed for {func.__name__}: {e}. "
+                                f"Retrying in {delay:.2f}s..."
+                            )
+                            await asyncio.sleep(delay)
+                            delay *= backoff_factor
+                        else:
+                            logger.exception(
+                                f"All {max_retries + 1} attempts failed for {func.__name__}: {e}"
+                            )
+
+                raise last_exception  # type: ignore
+
+            return cast(Callable[..., T], async_wrapper)
+
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> T:
             delay = initial_delay
@@ -70,23 +149,39 @@ def handle_llm_error(func: Callable[..., Any]) -> Callable[..., Any]:
     return wrapper
 
 
+def _graph_error_state(kwargs: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "messages": kwargs.get("messages", []),
+        "query": kwargs.get("query", ""),
+        "retrieved_docs": [],
+        "distances": [],
+        "needs_clarification": False,
+        "answer": (
+            "I encountered an error while processing your query. "
+            "Please try again or contact support if the issue persists."
+        ),
+    }
+
+
 def handle_graph_execution_error(func: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"Graph execution error in {func.__name__}: {e}")
+                return _graph_error_state(kwargs)
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
         try:
             return func(*args, **kwargs)
         except Exception as e:
             logger.exception(f"Graph execution error in {func.__name__}: {e}")
-            return {
-                "messages": kwargs.get("messages", []),
-                "query": kwargs.get("query", ""),
-                "retrieved_docs": [],
-                "distances": [],
-                "needs_clarification": False,
-                "answer": (
-                    "I encountered an error while processing your query. "
-                    "Please try again or contact support if the issue persists."
-                ),
-            }
+            return _graph_error_state(kwargs)
 
     return wrapper
@@ -0,0 +1,176 @@
+import asyncio
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+from app.retrieval import _INDEX_READ_FLAGS, BatchingRetriever, DocumentRetriever
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors, so index tests do not need to download a model."""
+
+    model = SimpleNamespace(backend="fake")
+    precision = "fp32"
+    dimension = 64
+
+    def encode_documents(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts):
+        return self.encode_documents(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode_documents([text])[0].tolist()
+
+    def normalize_query(self, text):
+        return " ".join(text.split())
+
+    def embed_query_vectors(self, texts):
+        return self.encode_documents([self.normalize_query(text) for text in texts])
+
+    def query_cache_stats(self):
+        return {}
+
+
+def _run(coroutine):
+    # A lost future would otherwise hang the test run instead of failing it.
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+
+def _retriever(data_dir) -> DocumentRetriever:
+    retriever = DocumentRetriever(data_dir=str(data_dir), embedding_model="fake")
+    retriever._embeddings = FakeEmbeddings()
+    return retriever
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.retrieval, "index_cache", True)
+    monkeypatch.setattr(settings.retrieval, "index_type", "flat")
+    monkeypatch.setattr(settings.retrieval, "index_precision", "fp16")
+    (tmp_path / "apples.md").write_text("apples grow on trees in orchards")
+    (tmp_path / "rivers.md").write_text("rivers flow into the sea")
+    (tmp_path / "engines.md").write_text("engines burn fuel to make power")
+    return tmp_path
+
+
+def test_index_is_persisted_and_memory_mapped(corpus):
+    built = _retriever(corpus)
+    expected = built.get_relevant_documents("apples orchards", k=2)
+    entries = list((corpus / "index").iterdir())
+    assert len(entries) == 1
+
+    loaded = _retriever(corpus)
+    documents, distances = loaded.get_relevant_documents("apples orchards", k=2)
+
+    assert loaded._index_read_only == (_INDEX_READ_FLAGS != 0)
+    assert loaded.vector_store.index.ntotal == built.vector_store.index.ntotal
+    assert [doc.page_content for doc in documents] == [doc.page_content for doc in expected[0]]
+    assert distances == pytest.approx(expected[1])
+    assert loaded.get_stats()["documents"] == 3
+
+
+def test_add_documents_to_loaded_index(corpus):
+    _retriever(corpus).vector_store
+    loaded = _retriever(corpus)
+    total = loaded.vector_store.index.ntotal
+
+    loaded.add_documents(
+        [Document(page_content="zebras and giraffes", metadata={"source": "z.md"})]
+    )
+    documents, distances = loaded.get_relevant_documents("zebras and giraffes", k=1)
+
+    assert loaded.vector_store.index.ntotal == total + 1
+    assert documents[0].metadata["source"] == "z.md"
+    assert distances[0] == pytest.approx(0.0, abs=1e-3)
+    # Inserts go to an in-memory copy; the persisted index still matches the corpus on disk.
+    assert _retriever(corpus).vector_store.index.ntotal == total
+
+
+class FakeRetriever:
+    similarity_top_k = 2
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = []
+
+    def get_relevant_documents_batch(self, queries, k=None):
+        self.calls.append((list(queries), k))
+        if self.fail:
+            raise RuntimeError("index unavailable")
+        return [
+            (
+                [Document(page_content=f"{query}-{i}") for i in range(k)],
+                [float(i) for i in range(k)],
+            )
+            for query in queries
+        ]
+
+
+def test_batching_retriever_fans_out_mixed_k():
+    retriever = FakeRetriever()
+    batcher = BatchingRetriever(retriever, max_batch_size=8, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.get_relevant_documents("a", k=1),
+            batcher.get_relevant_documents("b"),
+            batcher.get_relevant_documents("c", k=3),
+        )
+
+    (docs_a, dist_a), (docs_b, dist_b), (docs_c, dist_c) = _run(run())
+
+    assert retriever.calls == [(["a", "b", "c"], 3)]
+    assert [doc.page_content for doc in docs_a] == ["a-0"]
+    assert [doc.page_content for doc in docs_b] == ["b-0", "b-1"]
+    assert [doc.page_content for doc in docs_c] == ["c-0", "c-1", "c-2"]
+    assert (dist_a, dist_b, dist_c) == ([0.0], [0.0, 1.0], [0.0, 1.0, 2.0])
+
+
+def test_batching_retriever_survives_cancelled_callers():
+    retriever = FakeRetriever()
+    batcher = BatchingRetriever(retriever, max_batch_size=8, max_wait_ms=50)
+
+    async def run():
+        cancelled = asyncio.create_task(batcher.get_relevant_documents("a"))
+        kept = asyncio.create_task(batcher.get_relevant_documents("b"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        documents, _ = await kept
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        # The worker keeps serving after a caller went away.
+        later, _ = await batcher.get_relevant_documents("c", k=1)
+        return documents, later
+
+    documents, later = _run(run())
+
+    assert [doc.page_content for doc in documents] == ["b-0", "b-1"]
+    assert [doc.page_content for doc in later] == ["c-0"]
+
+
+def test_batching_retriever_returns_empty_results_on_errors():
+    batcher = BatchingRetriever(FakeRetriever(fail=True), max_batch_size=8, max_wait_ms=1)
+
+    assert _run(batcher.get_relevant_documents("a")) == ([], [])
+
+
+def test_batching_retriever_restarts_on_a_new_event_loop():
+    retriever = FakeRetriever()
+    batcher = BatchingRetriever(retriever, max_batch_size=8, max_wait_ms=1)
+
+    _run(batcher.get_relevant_documents("a"))
+    _run(batcher.get_relevant_documents("b"))
+
+    assert [queries for queries, _ in retriever.calls] == [["a"], ["b"]]